@@ -1,5 +1,5 @@
 from pathlib import Path
-from gel_mcp.common.types import MCPExample, Workflow
+from gel_mcp.common.types import MCPExample, Test, Workflow
 
 """
 This is glue code to import examples from the Gel Workflow Creator.
@@ -19,3 +19,13 @@ def import_from_workflows(workflows_file: Path) -> list[MCPExample]:
             mcp_examples.append(MCPExample.from_workflow_example(example))
 
     return mcp_examples
+
+
+def import_tests_from_workflows(workflows_file: Path) -> list[Test]:
+    if not workflows_file.exists():
+        raise FileNotFoundError(f"Workflows file not found: {workflows_file}")
+
+    with workflows_file.open("r") as f:
+        workflows = [Workflow.model_validate_json(line) for line in f]
+
+    return [test for workflow in workflows for test in workflow.tests]
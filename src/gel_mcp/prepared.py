@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from typing import Any
+
+import gel
+from gel import describe
+from gel.protocol.protocol import OutputFormat
+from pydantic import BaseModel
+
+"""
+Registry of named prepared queries.
+
+A query is described once when it is prepared: the server compiles it and
+reports its parameter types, which are cached alongside the query text. The
+client that described it keeps the compiled query in its cache, so later runs
+only send the name and the arguments. Entries are kept in a bounded LRU and
+dropped once a schema change makes them fail to compile.
+"""
+
+PREPARED_QUERY_CACHE_SIZE = 128
+
+
+class PreparedParameter(BaseModel):
+    """A query parameter as reported by the server"""
+
+    type_name: str
+    required: bool
+
+
+class PreparedQuery(BaseModel):
+    """A query registered under a name, along with its parameter types"""
+
+    name: str
+    query: str
+    branch: str | None = None
+    parameters: dict[str, PreparedParameter]
+    hits: int = 0
+
+    def describe_parameters(self) -> dict[str, str]:
+        return {
+            name: param.type_name if param.required else f"optional {param.type_name}"
+            for name, param in self.parameters.items()
+        }
+
+    def check_arguments(self, arguments: dict[str, Any]) -> None:
+        """Check argument names against the cached parameters.
+
+        Only names and required-ness are checked here. Values are checked
+        against the parameter types when the client encodes them, which
+        raises QueryArgumentError on a mismatch.
+        """
+        unknown = arguments.keys() - self.parameters.keys()
+        if unknown:
+            raise ValueError(
+                f"Unknown arguments for prepared query {self.name}: "
+                f"{', '.join(sorted(unknown))}"
+            )
+
+        missing = [
+            name
+            for name, param in self.parameters.items()
+            if param.required and arguments.get(name) is None
+        ]
+        if missing:
+            raise ValueError(
+                f"Missing required arguments for prepared query {self.name}: "
+                f"{', '.join(missing)}"
+            )
+
+
+class PreparedQueryRegistry:
+    """Bounded LRU of prepared queries, keyed by name"""
+
+    def __init__(self, max_size: int = PREPARED_QUERY_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, PreparedQuery] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def register(self, entry: PreparedQuery) -> set[str | None]:
+        """Add an entry, evicting the least recently used ones over max_size.
+
+        Returns the branches of the entries it replaced or evicted.
+        """
+        removed: set[str | None] = set()
+        replaced = self._entries.get(entry.name)
+        if replaced is not None:
+            removed.add(replaced.branch)
+
+        self._entries[entry.name] = entry
+        self._entries.move_to_end(entry.name)
+        while len(self._entries) > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            removed.add(evicted.branch)
+        return removed
+
+    def get(self, name: str) -> PreparedQuery:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise ValueError(f"Prepared query {name} not found")
+        self._entries.move_to_end(name)
+        return entry
+
+    def record_hit(self, name: str) -> None:
+        """Count a successful run of a prepared query"""
+        entry = self._entries.get(name)
+        if entry is not None:
+            entry.hits += 1
+
+    def entries(self) -> list[PreparedQuery]:
+        """Entries from least to most recently used"""
+        return list(self._entries.values())
+
+    def branches(self) -> set[str | None]:
+        """Branches that have at least one prepared query"""
+        return {e.branch for e in self._entries.values()}
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def invalidate(self, branch: str | None) -> None:
+        """Drop every entry prepared against the given branch"""
+        for name in [n for n, e in self._entries.items() if e.branch == branch]:
+            del self._entries[name]
+
+
+def _type_name(type_: describe.AnyType) -> str:
+    if type_.name:
+        return type_.name
+    if isinstance(type_, describe.ArrayType):
+        return f"array<{_type_name(type_.element_type)}>"
+    return type(type_).__name__
+
+
+async def prepare_query(
+    client: gel.AsyncIOClient, name: str, query: str, branch: str | None = None
+) -> PreparedQuery:
+    """Compile a query on the server and record its parameter types."""
+    # The client has no public API to describe a query, and describing is the
+    # only way to learn the parameter types without executing the query. It
+    # goes through the client's query cache, which is keyed on output format,
+    # so it has to match the query_json call in run_prepared.
+    description = await client._describe_query(query, output_format=OutputFormat.JSON)
+
+    parameters: dict[str, PreparedParameter] = {}
+    if isinstance(description.input_type, describe.ObjectType):
+        for param, element in description.input_type.elements.items():
+            if param.isdigit():
+                raise ValueError(
+                    "Prepared queries only support named parameters, "
+                    f"got positional ${param}"
+                )
+            parameters[param] = PreparedParameter(
+                type_name=_type_name(element.type),
+                required=element.cardinality == gel.Cardinality.ONE,
+            )
+
+    return PreparedQuery(
+        name=name,
+        query=query,
+        branch=branch,
+        parameters=parameters,
+    )
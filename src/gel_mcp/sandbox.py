@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import re
+import uuid
+
+import gel
+
+from gel_mcp.common.types import Test
+
+"""
+Provisioning of sandbox branches from the initial state of workflow tests.
+
+A test's initial state is materialized once into a template branch whose name
+is derived from a hash of its snippets. Sandboxes are cheap data copies of
+that template, so repeated runs skip the migrate-and-seed cycle.
+"""
+
+TEMPLATE_PREFIX = "mcp_tpl_"
+SANDBOX_PREFIX = "mcp_sbx_"
+
+SCHEMA_LANGUAGES = {"gel", "sdl", "esdl"}
+SEED_LANGUAGES = {"edgeql"}
+
+BRANCH_NAME_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+_template_lock = asyncio.Lock()
+
+
+SDL_TOKEN_RE = re.compile(r"\bmodule\s+([\w:]+)\s*\{|\btype\s+([\w:]+)|\{|\}")
+
+
+def _declared_types(sdl: str) -> set[str]:
+    """Module-qualified names of the types declared in an SDL snippet."""
+    declared: set[str] = set()
+    # One entry per open brace: the module it opens, or None for other blocks
+    blocks: list[str | None] = []
+    for match in SDL_TOKEN_RE.finditer(re.sub(r"#.*", "", sdl)):
+        module, type_name = match.groups()
+        if module is not None:
+            blocks.append(module)
+        elif type_name is not None:
+            modules = [m for m in blocks if m is not None]
+            if "::" not in type_name:
+                type_name = "::".join([*modules, type_name])
+            declared.add(type_name)
+        elif match.group() == "{":
+            blocks.append(None)
+        elif blocks:
+            blocks.pop()
+    return declared
+
+
+def split_initial_state(test: Test) -> tuple[str, list[str]]:
+    """Split a test's initial state into one SDL schema and the seed scripts.
+
+    Schema files are merged into a single schema, the way a project's
+    dbschema directory is. Snippets that are neither SDL nor EdgeQL, such as
+    application code, are not part of the database state and are skipped. A schema snippet for an already seen file, or one
+    redeclaring types of an earlier snippet, is a later version of the same
+    schema (e.g. the expected outcome) and is left out.
+    """
+    schema: list[str] = []
+    seed: list[str] = []
+    seen_urls: set[str] = set()
+    seen_types: set[str] = set()
+    for snippet in test.initial_state:
+        if not snippet.code:
+            continue
+        is_schema = snippet.language in SCHEMA_LANGUAGES or (
+            snippet.url is not None and snippet.url.endswith(".gel")
+        )
+        is_seed = snippet.language in SEED_LANGUAGES or (
+            snippet.url is not None and snippet.url.endswith(".edgeql")
+        )
+        if is_seed:
+            seed.append(snippet.code)
+            continue
+        if not is_schema:
+            continue
+
+        declared = _declared_types(snippet.code)
+        if snippet.url in seen_urls or declared & seen_types:
+            continue
+        if snippet.url is not None:
+            seen_urls.add(snippet.url)
+        seen_types |= declared
+        schema.append(snippet.code)
+    return "\n\n".join(schema), seed
+
+
+def initial_state_hash(test: Test) -> str:
+    """Stable hash of the snippets that make up a test's initial state."""
+    payload = json.dumps(
+        [[s.url, s.language, s.code] for s in test.initial_state],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def template_branch_name(test: Test) -> str:
+    return f"{TEMPLATE_PREFIX}{initial_state_hash(test)[:16]}"
+
+
+def validate_branch_name(name: str) -> None:
+    if not BRANCH_NAME_RE.match(name):
+        raise ValueError(
+            f"Invalid branch name {name!r}: "
+            "use lowercase letters, digits and underscores"
+        )
+
+
+async def branch_exists(client: gel.AsyncIOClient, name: str) -> bool:
+    result = await client.query_single(
+        "select exists (select sys::Branch filter .name = <str>$name)", name=name
+    )
+    return bool(result)
+
+
+async def drop_branch(client: gel.AsyncIOClient, name: str) -> None:
+    validate_branch_name(name)
+    await client.execute(f"drop branch {name}")
+
+
+async def prune_templates(client: gel.AsyncIOClient, keep: set[str]) -> list[str]:
+    """Drop template branches, and leftover staging branches, not in `keep`.
+
+    Returns the names of the dropped branches.
+    """
+    async with _template_lock:
+        names = await client.query("select sys::Branch.name")
+        stale = sorted(
+            name
+            for name in names
+            if name.startswith(TEMPLATE_PREFIX) and name not in keep
+        )
+        for name in stale:
+            await drop_branch(client, name)
+    return stale
+
+
+async def _materialize(branch: str, schema: str, seed: list[str]) -> None:
+    """Migrate a branch to the given schema, then run the seed scripts."""
+    branch_client: gel.AsyncIOClient = gel.create_async_client(branch=branch)
+    try:
+        if schema:
+            await branch_client.execute(
+                f"start migration to {{ {schema} }}; populate migration; commit migration;"
+            )
+        for script in seed:
+            await branch_client.execute(script)
+    finally:
+        # Branch DDL (rename, copy) requires that nobody is connected to it
+        await branch_client.aclose()
+
+
+async def ensure_template_branch(client: gel.AsyncIOClient, test: Test) -> str:
+    """Return the template branch for a test, building it on first use.
+
+    The template is built under a staging name and renamed once complete,
+    so a failed or interrupted build never leaves a half-seeded template behind.
+    """
+    template = template_branch_name(test)
+    async with _template_lock:
+        if await branch_exists(client, template):
+            return template
+
+        staging = f"{template}_wip"
+        if await branch_exists(client, staging):
+            await drop_branch(client, staging)
+
+        schema, seed = split_initial_state(test)
+        await client.execute(f"create empty branch {staging}")
+        try:
+            await _materialize(staging, schema, seed)
+        except Exception:
+            await drop_branch(client, staging)
+            raise
+        await client.execute(f"alter branch {staging} rename to {template}")
+
+    return template
+
+
+async def fork_template_branch(
+    client: gel.AsyncIOClient, template: str, name: str | None = None
+) -> str:
+    """Create a data copy of a template branch and return the new branch name.
+
+    Sandbox names always carry SANDBOX_PREFIX so they can be told apart from
+    (and never mistaken for) the user's own branches.
+    """
+    if name is None:
+        key = template.removeprefix(TEMPLATE_PREFIX)
+        name = f"{key}_{uuid.uuid4().hex[:8]}"
+    if not name.startswith(SANDBOX_PREFIX):
+        name = f"{SANDBOX_PREFIX}{name}"
+    validate_branch_name(name)
+    validate_branch_name(template)
+    await client.execute(f"create data branch {name} from {template}")
+    return name
@@ -3,14 +3,25 @@ from pathlib import Path
 import gel
 import argparse
 import json
+from collections import Counter
+from collections.abc import Iterable
 from typing import Any
 
-from gel_mcp.import_from_workflows import import_from_workflows
-from gel_mcp.common.types import MCPExample
+from gel_mcp.import_from_workflows import (
+    import_from_workflows,
+    import_tests_from_workflows,
+)
+from gel_mcp.common.types import MCPExample, Test
+from gel_mcp import prepared, sandbox
 
 
 mcp = FastMCP("gel-mcp")
 
+prepared_queries = prepared.PreparedQueryRegistry()
+_pooled_clients: dict[str | None, gel.AsyncIOClient] = {}
+# Number of prepare_query calls currently describing a query on each branch
+_preparing: Counter[str | None] = Counter()
+
 WORKFLOWS_PATH = Path(__file__).parent / "static" / "workflows.jsonl"
 assert WORKFLOWS_PATH.exists(), "Workflows file does not exist"
 assert WORKFLOWS_PATH.is_file(), "Workflows file is not a file"
@@ -29,6 +40,46 @@ def fetch_examples(workflows_path: Path) -> list[MCPExample]:
     return import_from_workflows(workflows_path)
 
 
+def fetch_tests(workflows_path: Path) -> list[Test]:
+    """Load workflow tests from workflows file."""
+    if not workflows_path.exists():
+        raise FileNotFoundError(
+            f"Missing default workflows file: {workflows_path.as_posix()}"
+        )
+    return import_tests_from_workflows(workflows_path)
+
+
+def create_client(branch: str | None = None) -> gel.AsyncIOClient:
+    """Create a client for the project's instance, optionally on another branch."""
+    gel_client: gel.AsyncIOClient
+    if branch:
+        gel_client = gel.create_async_client(branch=branch)
+    else:
+        gel_client = gel.create_async_client()
+    return gel_client
+
+
+def get_pooled_client(branch: str | None = None) -> gel.AsyncIOClient:
+    """Long-lived client for a branch, so compiled queries stay cached across calls."""
+    gel_client = _pooled_clients.get(branch)
+    if gel_client is None:
+        gel_client = _pooled_clients[branch] = create_client(branch)
+    return gel_client
+
+
+async def release_pooled_clients(branches: Iterable[str | None]) -> None:
+    """Close the pooled clients of the given branches if nothing uses them
+
+    A branch is in use while it has prepared queries or a query is being
+    prepared on it.
+    """
+    in_use = prepared_queries.branches() | set(_preparing)
+    for branch in set(branches) - in_use:
+        gel_client = _pooled_clients.pop(branch, None)
+        if gel_client is not None:
+            await gel_client.aclose()
+
+
 @mcp.tool()
 async def list_examples() -> list[str]:
     """List all available code and workflow examples and their slugs"""
@@ -48,6 +99,7 @@ async def execute_query(
     query: str,
     arguments: dict[str, Any] | None = None,
     globals: dict[str, Any] | None = None,
+    branch: str | None = None,
 ) -> list[Any]:
     """Execute a query and return the result as JSON
 
@@ -55,18 +107,25 @@ async def execute_query(
         query: The EdgeQL query to execute
         arguments: Optional dictionary of query parameters to pass to the query
         globals: Optional dictionary of global variables to pass to the query
+        branch: Optional branch to run the query against, e.g. a sandbox branch
 
     Returns:
         List containing the query result in JSON format
     """
-    gel_client = gel.create_async_client()
+    base_client = create_client(branch)
+    gel_client = base_client
     if globals:
         gel_client = gel_client.with_globals(**globals)
 
-    if arguments:
-        result = await gel_client.query_json(query, **arguments)
-    else:
-        result = await gel_client.query_json(query)
+    try:
+        if arguments:
+            result = await gel_client.query_json(query, **arguments)
+        else:
+            result = await gel_client.query_json(query)
+    finally:
+        # An idle connection left open on a sandbox branch prevents dropping it
+        if branch:
+            await base_client.aclose()
 
     if result is None:
         raise ValueError("Query returned None")
@@ -83,6 +142,7 @@ async def try_query(
     query: str,
     arguments: dict[str, Any] | None = None,
     globals: dict[str, Any] | None = None,
+    branch: str | None = None,
 ) -> list[Any]:
     """Execute a query in a transaction that gets rolled back, allowing you to test queries without making permanent changes
 
@@ -90,11 +150,13 @@ async def try_query(
         query: The EdgeQL query to execute
         arguments: Optional dictionary of query parameters to pass to the query
         globals: Optional dictionary of global variables to pass to the query
+        branch: Optional branch to run the query against, e.g. a sandbox branch
 
     Returns:
         List containing the query result in JSON format (changes are not persisted)
     """
-    gel_client = gel.create_async_client()
+    base_client = create_client(branch)
+    gel_client = base_client
 
     if globals:
         gel_client = gel_client.with_globals(**globals)
@@ -119,6 +181,10 @@ async def try_query(
     except IntentionalRollback:
         # This is expected - we intentionally caused a rollback
         pass
+    finally:
+        # An idle connection left open on a sandbox branch prevents dropping it
+        if branch:
+            await base_client.aclose()
 
     if result is None:
         raise ValueError("Query returned None")
@@ -130,6 +196,181 @@ async def try_query(
     return parsed_result
 
 
+@mcp.tool()
+async def prepare_query(
+    name: str, query: str, branch: str | None = None
+) -> dict[str, str]:
+    """Compile a query once and register it under a name for use with run_prepared
+
+    Prefer this over execute_query when running the same query repeatedly with
+    different arguments, e.g. fetching each user by id in a loop.
+
+    Args:
+        name: Name to register the query under, replacing any query with that name
+        query: The EdgeQL query to prepare, using named parameters
+        branch: Optional branch to run the query against, e.g. a sandbox branch
+
+    Returns:
+        Dictionary mapping each query parameter to its type
+    """
+    gel_client = get_pooled_client(branch)
+    _preparing[branch] += 1
+    try:
+        entry = await prepared.prepare_query(gel_client, name, query, branch)
+    finally:
+        _preparing[branch] -= 1
+        if not _preparing[branch]:
+            del _preparing[branch]
+
+    # Registering may have evicted the last entries of other branches
+    await release_pooled_clients(prepared_queries.register(entry))
+    return entry.describe_parameters()
+
+
+@mcp.tool()
+async def run_prepared(
+    name: str,
+    arguments: dict[str, Any] | None = None,
+    globals: dict[str, Any] | None = None,
+) -> list[Any]:
+    """Execute a query registered with prepare_query and return the result as JSON
+
+    Prepared queries are dropped, along with the other queries prepared on the
+    same branch, once a run fails because the query no longer compiles. They then
+    have to be prepared again. Schema changes that keep a query compiling are not
+    detected, so prepare it again if its parameter types may have changed.
+
+    Args:
+        name: Name the query was registered under
+        arguments: Optional dictionary of query parameters to pass to the query
+        globals: Optional dictionary of global variables to pass to the query
+
+    Returns:
+        List containing the query result in JSON format
+    """
+    entry = prepared_queries.get(name)
+    gel_client = get_pooled_client(entry.branch)
+
+    arguments = arguments or {}
+    entry.check_arguments(arguments)
+
+    if globals:
+        gel_client = gel_client.with_globals(**globals)
+
+    try:
+        result = await gel_client.query_json(entry.query, **arguments)
+    except gel.errors.QueryError as e:
+        # The query compiled when it was prepared, so a compile error now means
+        # the branch's schema has changed and the cached parameters are stale
+        prepared_queries.invalidate(entry.branch)
+        await release_pooled_clients([entry.branch])
+        raise ValueError(
+            f"{name} no longer compiles, the schema has likely changed since it "
+            f"was prepared. Prepare it again: {e}"
+        ) from e
+
+    prepared_queries.record_hit(name)
+
+    if result is None:
+        raise ValueError("Query returned None")
+
+    parsed_result = json.loads(result)
+    assert isinstance(parsed_result, list), (
+        f"Expected list from query, got {type(parsed_result)}"
+    )
+    return parsed_result
+
+
+@mcp.tool()
+async def list_prepared_queries() -> list[str]:
+    """List prepared queries with their hit counts, most recently used first"""
+    return [
+        f"<{e.name}> hits={e.hits} params={e.describe_parameters()}: {e.query}"
+        for e in reversed(prepared_queries.entries())
+    ]
+
+
+@mcp.tool()
+async def list_tests() -> list[str]:
+    """List all workflow tests and their ids"""
+    tests = fetch_tests(WORKFLOWS_PATH)
+    return [f"<{t.id}> {t.test_prompt}" for t in tests]
+
+
+@mcp.tool()
+async def provision_test_branch(test_id: str, branch: str | None = None) -> str:
+    """Create a sandbox branch holding the initial state of a workflow test
+
+    The initial state (schema and seed data) is migrated into a template branch
+    once and cached under a hash of its snippets. Every call then makes a cheap
+    data copy of that template instead of re-running migrations and inserts.
+
+    Args:
+        test_id: Id of the workflow test, as listed by list_tests
+        branch: Optional name for the new branch, generated if not given.
+            It is prefixed with mcp_sbx_ if it isn't already
+
+    Returns:
+        Name of the sandbox branch, to be passed as `branch` to execute_query
+    """
+    test = next((t for t in fetch_tests(WORKFLOWS_PATH) if t.id == test_id), None)
+    if test is None:
+        raise ValueError(f"Test {test_id} not found")
+
+    gel_client = create_client()
+    try:
+        template = await sandbox.ensure_template_branch(gel_client, test)
+        new_branch = await sandbox.fork_template_branch(gel_client, template, branch)
+    finally:
+        await gel_client.aclose()
+
+    # Queries prepared against an earlier branch of the same name are stale
+    prepared_queries.invalidate(new_branch)
+    await release_pooled_clients([new_branch])
+    return new_branch
+
+
+@mcp.tool()
+async def drop_test_branch(branch: str) -> None:
+    """Drop a sandbox branch created by provision_test_branch"""
+    if not branch.startswith(sandbox.SANDBOX_PREFIX):
+        raise ValueError(
+            f"Refusing to drop {branch}: only branches prefixed with "
+            f"{sandbox.SANDBOX_PREFIX} can be dropped"
+        )
+
+    # Nobody may be connected to a branch that is being dropped
+    pooled_client = _pooled_clients.pop(branch, None)
+    if pooled_client is not None:
+        await pooled_client.aclose()
+    prepared_queries.invalidate(branch)
+
+    gel_client = create_client()
+    try:
+        await sandbox.drop_branch(gel_client, branch)
+    finally:
+        await gel_client.aclose()
+
+
+@mcp.tool()
+async def prune_test_templates() -> list[str]:
+    """Drop cached template branches that no longer match any workflow test
+
+    Templates are keyed on a test's initial state, so editing a test leaves its
+    old template behind. Sandboxes already forked from a template are kept.
+
+    Returns:
+        Names of the dropped template branches
+    """
+    keep = {sandbox.template_branch_name(t) for t in fetch_tests(WORKFLOWS_PATH)}
+
+    gel_client = create_client()
+    try:
+        return await sandbox.prune_templates(gel_client, keep)
+    finally:
+        await gel_client.aclose()
+
+
 @mcp.tool()
 async def list_rules() -> list[str]:
     """
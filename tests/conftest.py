@@ -112,3 +112,22 @@ async def gel_is_initialized():
 
     run_in_shell(["gel", "project", "init", "--non-interactive"])
     yield
+
+
+@pytest.fixture
+def drop_template():
+    """Drop the template branch a workflow test was provisioned from."""
+    import gel
+
+    from gel_mcp import sandbox
+
+    async def drop(test):
+        client = gel.create_async_client()
+        try:
+            template = sandbox.template_branch_name(test)
+            if await sandbox.branch_exists(client, template):
+                await sandbox.drop_branch(client, template)
+        finally:
+            await client.aclose()
+
+    return drop
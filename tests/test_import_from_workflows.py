@@ -5,7 +5,10 @@ import pytest
 from pathlib import Path
 from pydantic_core import ValidationError
 
-from gel_mcp.import_from_workflows import import_from_workflows
+from gel_mcp.import_from_workflows import (
+    import_from_workflows,
+    import_tests_from_workflows,
+)
 from gel_mcp.common.types import MCPExample
 
 
@@ -97,6 +100,39 @@ def test_import_error_cases(tmp_path):
         import_from_workflows(malformed_file)
 
 
+def test_import_tests_from_workflows(tmp_path):
+    """Test importing workflow tests with their initial state."""
+    workflows_file = tmp_path / "tests_workflows.jsonl"
+
+    workflow = {
+        "id": "workflow-1",
+        "name": "Workflow With Tests",
+        "tests": [
+            {
+                "id": "test-1",
+                "test_prompt": "Add a Kek type",
+                "initial_state": [
+                    {
+                        "id": "snippet-1",
+                        "url": "dbschema/default.gel",
+                        "code": "module default {}",
+                        "language": "gel",
+                    }
+                ],
+            }
+        ],
+        "examples": [],
+    }
+
+    with workflows_file.open("w") as f:
+        f.write(json.dumps(workflow) + "\n")
+
+    tests = import_tests_from_workflows(workflows_file)
+    assert len(tests) == 1
+    assert tests[0].id == "test-1"
+    assert tests[0].initial_state[0].url == "dbschema/default.gel"
+
+
 def test_default_workflows_file_exists():
     """Test that the default workflows file exists in the expected location."""
     workflows_path = (
@@ -0,0 +1,184 @@
+"""Tests for gel_mcp.prepared module."""
+
+from unittest.mock import patch
+
+import pytest
+
+from gel_mcp.common.types import CodeSnippet
+from gel_mcp.common.types import Test as WorkflowTest
+from gel_mcp.prepared import PreparedParameter, PreparedQuery, PreparedQueryRegistry
+
+
+def make_entry(name: str, branch: str | None = None) -> PreparedQuery:
+    return PreparedQuery(
+        name=name,
+        query="select User filter .id = <uuid>$id",
+        branch=branch,
+        parameters={
+            "id": PreparedParameter(type_name="std::uuid", required=True),
+            "limit": PreparedParameter(type_name="std::int64", required=False),
+        },
+    )
+
+
+def test_registry_evicts_least_recently_used():
+    """Test the registry stays bounded and evicts the least recently used entry."""
+    registry = PreparedQueryRegistry(max_size=2)
+    registry.register(make_entry("a"))
+    registry.register(make_entry("b"))
+
+    registry.get("a")
+    assert registry.register(make_entry("c", branch="mcp_sbx_c")) == {None}
+
+    assert len(registry) == 2
+    assert "a" in registry
+    assert "b" not in registry
+    assert [e.name for e in registry.entries()] == ["a", "c"]
+
+
+def test_registry_counts_hits():
+    """Test only recorded runs are counted and missing names are reported."""
+    registry = PreparedQueryRegistry()
+    registry.register(make_entry("a"))
+
+    registry.get("a")
+    registry.record_hit("a")
+    registry.record_hit("a")
+    assert registry.get("a").hits == 2
+
+    with pytest.raises(ValueError, match="Prepared query missing not found"):
+        registry.get("missing")
+
+
+def test_registry_invalidates_per_branch():
+    """Test invalidation only drops entries prepared against that branch."""
+    registry = PreparedQueryRegistry()
+    registry.register(make_entry("main"))
+    registry.register(make_entry("sandbox", branch="mcp_sbx_test"))
+
+    assert registry.branches() == {None, "mcp_sbx_test"}
+
+    registry.invalidate("mcp_sbx_test")
+
+    assert "main" in registry
+    assert "sandbox" not in registry
+    assert registry.branches() == {None}
+
+
+def test_check_arguments():
+    """Test arguments are checked against the cached parameters."""
+    entry = make_entry("a")
+
+    entry.check_arguments({"id": "00000000-0000-0000-0000-000000000000"})
+    assert entry.describe_parameters() == {
+        "id": "std::uuid",
+        "limit": "optional std::int64",
+    }
+
+    with pytest.raises(ValueError, match="Missing required arguments.*id"):
+        entry.check_arguments({"limit": 1})
+
+    with pytest.raises(ValueError, match="Unknown arguments.*name"):
+        entry.check_arguments({"id": "x", "name": "y"})
+
+
+@pytest.fixture
+async def server_registry():
+    """Reset the server's prepared queries and close its pooled clients."""
+    from gel_mcp import server
+
+    yield server.prepared_queries
+    server.prepared_queries.clear()
+    await server.release_pooled_clients(list(server._pooled_clients))
+
+
+@pytest.mark.asyncio
+async def test_prepare_and_run_query(gel_is_initialized, server_registry):
+    """Test a prepared query can be run repeatedly by name."""
+    from gel_mcp.server import list_prepared_queries, prepare_query, run_prepared
+
+    params = await prepare_query("echo", "select <str>$pek")
+    assert params == {"pek": "std::str"}
+
+    assert await run_prepared("echo", {"pek": "a"}) == ["a"]
+    assert await run_prepared("echo", {"pek": "b"}) == ["b"]
+
+    listed = await list_prepared_queries()
+    assert listed[0].startswith("<echo> hits=2")
+
+    with pytest.raises(ValueError, match="Missing required arguments"):
+        await run_prepared("echo")
+
+    listed = await list_prepared_queries()
+    assert listed[0].startswith("<echo> hits=2")
+
+
+@pytest.mark.asyncio
+async def test_release_keeps_clients_in_use(server_registry):
+    """Test only clients of branches with no entries and no prepare are closed."""
+    from unittest.mock import AsyncMock
+
+    from gel_mcp import server
+
+    idle, preparing, registered = AsyncMock(), AsyncMock(), AsyncMock()
+    server._pooled_clients.update(
+        {"mcp_sbx_idle": idle, "mcp_sbx_preparing": preparing, None: registered}
+    )
+    server.prepared_queries.register(make_entry("a"))
+    server._preparing["mcp_sbx_preparing"] += 1
+    try:
+        await server.release_pooled_clients(list(server._pooled_clients))
+    finally:
+        del server._preparing["mcp_sbx_preparing"]
+
+    idle.aclose.assert_awaited_once()
+    preparing.aclose.assert_not_awaited()
+    registered.aclose.assert_not_awaited()
+    assert set(server._pooled_clients) == {"mcp_sbx_preparing", None}
+
+
+@pytest.mark.asyncio
+async def test_schema_change_invalidates_branch(
+    gel_is_initialized, server_registry, drop_template
+):
+    """Test a query that stops compiling drops its branch's entries and client."""
+    import gel
+
+    from gel_mcp import server
+
+    workflow_test = WorkflowTest(
+        id="test-prepared-schema-change",
+        initial_state=[
+            CodeSnippet(
+                id="schema",
+                url="dbschema/default.gel",
+                code="module default { type Pek { kek: str; } }",
+                language="gel",
+            )
+        ],
+    )
+    with patch("gel_mcp.server.fetch_tests", return_value=[workflow_test]):
+        branch = await server.provision_test_branch(workflow_test.id)
+
+    try:
+        await server.prepare_query(
+            "pek", "select Pek { kek } filter .kek = <str>$kek", branch=branch
+        )
+        await server.prepare_query("count", "select count(Pek)", branch=branch)
+        assert await server.run_prepared("pek", {"kek": "x"}) == []
+
+        branch_client = gel.create_async_client(branch=branch)
+        try:
+            await branch_client.execute("drop type Pek")
+        finally:
+            await branch_client.aclose()
+
+        with pytest.raises(ValueError, match="no longer compiles"):
+            await server.run_prepared("pek", {"kek": "x"})
+
+        assert branch not in server.prepared_queries.branches()
+        assert "count" not in server.prepared_queries
+        assert branch not in server._pooled_clients
+    finally:
+        await server.drop_test_branch(branch)
+        await drop_template(workflow_test)
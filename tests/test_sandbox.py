@@ -0,0 +1,179 @@
+"""Tests for gel_mcp.sandbox module."""
+
+from unittest.mock import patch
+
+import pytest
+
+from gel_mcp.common.types import CodeSnippet
+from gel_mcp.common.types import Test as WorkflowTest
+from gel_mcp.sandbox import (
+    SANDBOX_PREFIX,
+    TEMPLATE_PREFIX,
+    initial_state_hash,
+    split_initial_state,
+    template_branch_name,
+    validate_branch_name,
+)
+
+
+@pytest.fixture
+def sandbox_test():
+    """Workflow test with a schema file and a seed script."""
+    return WorkflowTest(
+        id="test-sandbox-1",
+        test_prompt="Do something with Kek",
+        initial_state=[
+            CodeSnippet(
+                id="schema",
+                url="dbschema/default.gel",
+                code="module default { type Kek { pek: str; } }",
+                language="gel",
+            ),
+            CodeSnippet(
+                id="seed",
+                code="insert Kek { pek := 'seeded' };",
+                language="edgeql",
+            ),
+        ],
+    )
+
+
+def test_split_initial_state(sandbox_test):
+    """Test schema and seed snippets are told apart by language and file."""
+    schema, seed = split_initial_state(sandbox_test)
+
+    assert schema == "module default { type Kek { pek: str; } }"
+    assert seed == ["insert Kek { pek := 'seeded' };"]
+
+
+def test_split_initial_state_skips_application_code(sandbox_test):
+    """Test snippets that are neither SDL nor EdgeQL are not run as seed."""
+    sandbox_test.initial_state.append(
+        CodeSnippet(
+            id="app",
+            url="app.py",
+            code="import gel\nclient = gel.create_client()",
+            language="python",
+        )
+    )
+
+    _, seed = split_initial_state(sandbox_test)
+
+    assert seed == ["insert Kek { pek := 'seeded' };"]
+
+
+def test_split_initial_state_merges_schema_files(sandbox_test):
+    """Test schema files are merged and later versions of them are left out."""
+    sandbox_test.initial_state += [
+        CodeSnippet(
+            id="other-module",
+            url="dbschema/other.gel",
+            code="module other { type Pek { kek: str; } }",
+            language="gel",
+        ),
+        CodeSnippet(
+            id="updated",
+            url="updated.gel",
+            # Kek is redeclared, so this is a new version of default.gel
+            code="module default { type Kek { pek: int64; } }",
+            language="sdl",
+        ),
+    ]
+
+    schema, _ = split_initial_state(sandbox_test)
+
+    assert "module other { type Pek" in schema
+    assert "pek: str" in schema
+    assert "pek: int64" not in schema
+
+
+def test_split_initial_state_keeps_same_type_in_other_module(sandbox_test):
+    """Test types are compared by module-qualified name."""
+    sandbox_test.initial_state.append(
+        CodeSnippet(
+            id="auth",
+            url="dbschema/auth.gel",
+            code="module auth { type Kek { token: str; } }",
+            language="gel",
+        )
+    )
+
+    schema, _ = split_initial_state(sandbox_test)
+
+    assert "module default { type Kek" in schema
+    assert "module auth { type Kek" in schema
+
+
+def test_template_name_is_keyed_on_snippets(sandbox_test):
+    """Test the template name is stable and changes with the snippets."""
+    name = template_branch_name(sandbox_test)
+    assert name.startswith(TEMPLATE_PREFIX)
+    assert name == template_branch_name(sandbox_test.model_copy(deep=True))
+    validate_branch_name(name)
+
+    changed = sandbox_test.model_copy(deep=True)
+    changed.initial_state[1].code = "insert Kek { pek := 'other' };"
+    assert initial_state_hash(changed) != initial_state_hash(sandbox_test)
+    assert template_branch_name(changed) != name
+
+
+def test_validate_branch_name_rejects_injection():
+    """Test branch names that aren't plain identifiers are rejected."""
+    with pytest.raises(ValueError, match="Invalid branch name"):
+        validate_branch_name("main; drop branch main")
+
+
+@pytest.mark.asyncio
+async def test_provision_test_branch(gel_is_initialized, sandbox_test, drop_template):
+    """Test sandboxes are forked from a single cached template."""
+    from gel_mcp.server import (
+        drop_test_branch,
+        execute_query,
+        provision_test_branch,
+    )
+
+    with patch("gel_mcp.server.fetch_tests", return_value=[sandbox_test]):
+        first = await provision_test_branch(sandbox_test.id)
+        second = await provision_test_branch(sandbox_test.id)
+
+    try:
+        assert first.startswith(SANDBOX_PREFIX)
+        assert first != second
+
+        await execute_query("delete Kek", branch=first)
+        assert await execute_query("select Kek { pek }", branch=first) == []
+        assert await execute_query("select Kek { pek }", branch=second) == [
+            {"pek": "seeded"}
+        ]
+    finally:
+        await drop_test_branch(first)
+        await drop_test_branch(second)
+        await drop_template(sandbox_test)
+
+
+@pytest.mark.asyncio
+async def test_prune_test_templates(gel_is_initialized, sandbox_test):
+    """Test templates of tests that are gone from the workflows are dropped."""
+    from gel_mcp.server import (
+        drop_test_branch,
+        provision_test_branch,
+        prune_test_templates,
+    )
+
+    template = template_branch_name(sandbox_test)
+    with patch("gel_mcp.server.fetch_tests", return_value=[sandbox_test]):
+        branch = await provision_test_branch(sandbox_test.id)
+        await drop_test_branch(branch)
+        assert template not in await prune_test_templates()
+
+    with patch("gel_mcp.server.fetch_tests", return_value=[]):
+        assert template in await prune_test_templates()
+
+
+@pytest.mark.asyncio
+async def test_drop_test_branch_refuses_other_branches():
+    """Test only sandbox branches can be dropped."""
+    from gel_mcp.server import drop_test_branch
+
+    with pytest.raises(ValueError, match="Refusing to drop"):
+        await drop_test_branch("main")